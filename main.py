@@ -1,15 +1,22 @@
 import os
 import json
-import pandas as pd
-from datetime import datetime, timedelta
+import re
+import csv
+import io
+import functools
+import copy
+import time
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
 from googleapiclient.discovery import build
-from google.adk.agents import Agent, SequentialAgent
+from google.adk.agents import Agent
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.models.google_llm import Gemini
 from google.adk.runners import InMemoryRunner
 from google.genai import types
-from discord_webhook import DiscordWebhook
+import httpx
 import asyncio
 
 # 1. Load Environment Variables
@@ -18,8 +25,26 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
 SPREADSHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-SHEET_RANGE = os.getenv("GOOGLE_SHEET_RANGE", "Sheet1!A:K")
+# Only DATE..UNIT (A:F) are read by the fallback; the query path filters on I:K server-side
+SHEET_RANGE = os.getenv("GOOGLE_SHEET_RANGE", "Sheet1!A:F")
+SHEET_NAME = SHEET_RANGE.split('!')[0] if '!' in SHEET_RANGE else 'Sheet1'
+# e.g. "gemini-2.5-flash-lite" for a faster, cheaper model
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 SERVICE_ACCOUNT_FILE = 'service_account.json'
+DATE_FORMAT = "%Y-%m-%d"  # Sheet DATE column and memory bank entries
+# Target categories for the client-side fallback, compiled once at import
+TARGET_CATEGORY_RE = re.compile(r"vegetable|spice|condiment|poultry", re.IGNORECASE)
+GVIZ_URL = "https://docs.google.com/spreadsheets/d/{spreadsheet_id}/gviz/tq"
+MEMORY_BANK_FILE = "memory_bank.json"
+SUGGESTIONS_FILE = "suggestions.jsonl"
+CACHE_DIR = ".cache"
+SHEET_CACHE_TTL = timedelta(hours=1)
+# Fetch results that mean "nothing usable"; never cached so a fixed sheet is picked up
+NO_SHEET_DATA = "No data found in the spreadsheet."
+NO_RECENT_INGREDIENTS = "No ingredients found in the last 4 days."
+NO_QUERY_MATCHES = f"{NO_RECENT_INGREDIENTS} Check if 'CATEGORY' column matches target categories."
+USER_ID = "debug_user_id"
+SESSION_ID = "debug_session_id"
 
 retry_config=types.HttpRetryOptions(
     attempts=5,  # Maximum retry attempts
@@ -28,100 +53,106 @@ retry_config=types.HttpRetryOptions(
     http_status_codes=[429, 500, 503, 504], # Retry on these HTTP errors
 )
 
-model = Gemini(model="gemini-2.5-flash", retry_config=retry_config)
+model = Gemini(model=GEMINI_MODEL, retry_config=retry_config)
+
+# --- Google Sheets Client ---
+
+@functools.lru_cache(maxsize=1)
+def _load_creds():
+    """Parses the service account key once and reuses the credentials (and their token)."""
+    return service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, 
+        scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
+    )
+
+@functools.lru_cache(maxsize=1)
+def _authorized_session():
+    """HTTP session for the query endpoint; refreshes the bearer token as needed."""
+    return AuthorizedSession(_load_creds())
+
+@functools.lru_cache(maxsize=1)
+def _build_sheets_service():
+    """Builds the Sheets client once so its HTTP connection is reused across fetches."""
+    return build('sheets', 'v4', credentials=_load_creds(), cache_discovery=False)
+
+def _cached_daily(fetch):
+    """
+    Caches the fetch result on disk per spreadsheet and day, so a re-run
+    (e.g. after a failed LLM stage) within SHEET_CACHE_TTL skips the Sheets API.
+    """
+    @functools.wraps(fetch)
+    def wrapper():
+        sheet_key = re.sub(r"\W+", "_", SHEET_NAME)
+        cache_file = os.path.join(CACHE_DIR, f"sheet_{SPREADSHEET_ID}_{sheet_key}_{date.today()}.json")
+        try:
+            if time.time() - os.stat(cache_file).st_mtime < SHEET_CACHE_TTL.total_seconds():
+                with open(cache_file, "r") as f:
+                    cached = json.load(f)
+                print("♻️ Using cached grocery data...")
+                return cached
+        except (OSError, ValueError):
+            pass  # Missing or unreadable cache is just a miss
+        
+        result = fetch()
+        if result in (NO_SHEET_DATA, NO_RECENT_INGREDIENTS, NO_QUERY_MATCHES):
+            return result
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_file, cache_file)
+        return result
+    return wrapper
+
+def _short_date(date_str):
+    """MM-DD is enough inside the 4-day window; unparseable dates are passed through."""
+    try:
+        return datetime.strptime(date_str, DATE_FORMAT).strftime("%m-%d")
+    except ValueError:
+        return date_str
 
 # --- REAL Tool Definitions ---
 
+@_cached_daily
 def fetch_recent_grocery_data():
     """
-    Connects to the real Google Sheet with SERVER-SIDE filtering using QUERY.
-    Only fetches items from the last 4 days (filtered in spreadsheet as a seprate sheet).
+    Connects to the real Google Sheet with SERVER-SIDE filtering using the
+    Visualization API query endpoint (same language as the QUERY formula).
+    Only fetches items from the last 4 days, and only the columns we use.
     Filters for Vegetables, Spices/Condiments, and Poultry.
-    
-    Requires a helper sheet named 'MealPlannerFilteredData' with a QUERY formula.
     """
     print(f"📊 Connecting to Google Sheet ID: {SPREADSHEET_ID}...")
     
     # Calculate cutoff date (4 days ago)
     cutoff_date = datetime.now() - timedelta(days=4)
     
-    # Authenticate with Google Sheets (needs write permission for helper sheet approach)
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, 
-        scopes=['https://www.googleapis.com/auth/spreadsheets']  # Need write permission
-    )
-    service = build('sheets', 'v4', credentials=creds)
-    
-    # Get the main sheet name
-    main_sheet = SHEET_RANGE.split('!')[0] if '!' in SHEET_RANGE else 'Sheet1'
-    helper_sheet = 'MealPlannerFilteredData'
-    
-    # Build QUERY formula for server-side filtering
+    # Build query for server-side filtering
     # Using DAY, MONTH, YEAR columns (I=9, J=10, K=11 in 1-indexed)
-    query_formula = f"""=QUERY({main_sheet}!A:K, "SELECT A, B, C, D, E, F, G, H, I, J, K WHERE (K > {cutoff_date.year} OR (K = {cutoff_date.year} AND J > {cutoff_date.month}) OR (K = {cutoff_date.year} AND J = {cutoff_date.month} AND I >= {cutoff_date.day})) AND (D contains 'Vegetable' OR D contains 'Spice' OR D contains 'Condiment' OR D contains 'Poultry')", 1)"""
+    query = f"SELECT A, B, D, E, F WHERE (K > {cutoff_date.year} OR (K = {cutoff_date.year} AND J > {cutoff_date.month}) OR (K = {cutoff_date.year} AND J = {cutoff_date.month} AND I >= {cutoff_date.day})) AND (D contains 'Vegetable' OR D contains 'Spice' OR D contains 'Condiment' OR D contains 'Poultry')"
     
     try:
-        # Check if helper sheet exists, if not create it
-        spreadsheet = service.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
-        sheets = spreadsheet.get('sheets', [])
-        helper_exists = any(sheet['properties']['title'] == helper_sheet for sheet in sheets)
-        
-        if not helper_exists:
-            # Create helper sheet
-            print(f"📝 Creating helper sheet '{helper_sheet}'...")
-            request_body = {
-                'requests': [{
-                    'addSheet': {
-                        'properties': {
-                            'title': helper_sheet
-                        }
-                    }
-                }]
-            }
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=SPREADSHEET_ID,
-                body=request_body
-            ).execute()
-        
-        # Update the helper sheet with QUERY formula
-        print(f"🔄 Updating QUERY formula...")
-        service.spreadsheets().values().update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{helper_sheet}!A1",
-            valueInputOption='USER_ENTERED',
-            body={'values': [[query_formula]]}
-        ).execute()
-        
-        # Give Google Sheets a moment to process the QUERY
-        import time
-        time.sleep(1)
-        
-        # Read the filtered data from helper sheet
+        # Only the filtered rows/columns cross the network, in one request
         print(f"📥 Fetching filtered data from server...")
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{helper_sheet}!A2:K"  # Skip header row
-        ).execute()
+        response = _authorized_session().get(
+            GVIZ_URL.format(spreadsheet_id=SPREADSHEET_ID),
+            params={'sheet': SHEET_NAME, 'tq': query, 'tqx': 'out:csv', 'headers': 1},
+            timeout=5.0,  # A stalled request falls through to the fallback below
+        )
+        response.raise_for_status()
         
-        values = result.get('values', [])
+        rows = csv.reader(io.StringIO(response.text))
+        next(rows, None)  # Skip header row
         
-        if not values:
-            print("⚠️ No ingredients found in the last 4 days")
-            return "No ingredients found in the last 4 days. Check if 'CATEGORY' column matches target categories."
+        # Format straight from the CSV reader (columns as selected: A, B, D, E, F)
+        # as compact ITEM|QTYUNIT|CATEGORY|MM-DD rows to keep the prompt small
+        inventory_list = [
+            f"{item}|{qty}{unit}|{category}|{_short_date(date_str)}"
+            for date_str, item, category, qty, unit in rows
+        ]
         
-        # Convert to readable list
-        inventory_list = []
-        for row in values:
-            if len(row) >= 11:  # Ensure row has all columns
-                item = row[1]  # ITEM (column B)
-                qty = row[4]   # QTY (column E)
-                unit = row[5]  # UNIT (column F)
-                category = row[3]  # CATEGORY (column D)
-                date_str = row[0]  # DATE (column A)
-                
-                inventory_list.append(
-                    f"{item} ({qty} {unit}) - {category} - bought on {date_str}"
-                )
+        if not inventory_list:
+            print("⚠️ No ingredients found in the last 4 days")
+            return NO_QUERY_MATCHES
         
         print(f"✅ Found {len(inventory_list)} ingredients from last 4 days")
         return "\n".join(inventory_list)
@@ -137,60 +168,138 @@ def fetch_recent_grocery_data_fallback():
     """Fallback method using client-side filtering if server-side fails."""
     print(f"📊 Using client-side filtering fallback...")
     
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, 
-        scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
-    )
-    service = build('sheets', 'v4', credentials=creds)
+    service = _build_sheets_service()
     
     sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=SHEET_RANGE).execute()
+    result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=SHEET_RANGE, fields='values').execute()
     values = result.get('values', [])
     
     if not values:
-        return "No data found in the spreadsheet."
+        return NO_SHEET_DATA
     
-    expected_cols = ["DATE", "ITEM", "STORE", "CATEGORY", "QTY", "UNIT", "PRICE", "COMMENT", "DAY", "MONTH", "YEAR"]
-    df = pd.DataFrame(values[1:], columns=expected_cols)
-    
-    df['DATE'] = pd.to_datetime(df['DATE'], errors='coerce')
     four_days_ago = datetime.now() - timedelta(days=4)
-    recent_items = df[df['DATE'] >= four_days_ago]
-    
-    target_categories = ["Vegetable", "Spice", "Condiment", "Poultry"]
-    category_mask = recent_items['CATEGORY'].astype(str).str.contains(
-        '|'.join(target_categories), case=False, na=False
-    )
-    filtered_items = recent_items[category_mask]
     
+    # Single pass over the raw rows: filter and format without building a DataFrame
     inventory_list = []
-    for _, row in filtered_items.iterrows():
-        inventory_list.append(
-            f"{row['ITEM']} ({row['QTY']} {row['UNIT']}) - {row['CATEGORY']} - bought on {row['DATE'].strftime('%Y-%m-%d')}"
-        )
+    for row in values[1:]:
+        row = row[:6] + [''] * (6 - len(row))  # Sheets omits trailing empty cells
+        date_str, item, _, category, qty, unit = row
+        
+        # Cheap category check first, so only matching rows pay for date parsing
+        if not TARGET_CATEGORY_RE.search(category):
+            continue
+        try:
+            bought = datetime.strptime(date_str, DATE_FORMAT)
+        except ValueError:
+            continue
+        if bought < four_days_ago:
+            continue
+        
+        inventory_list.append(f"{item}|{qty}{unit}|{category}|{bought:%m-%d}")
     
     if not inventory_list:
-        return "No ingredients found in the last 4 days."
+        return NO_RECENT_INGREDIENTS
     
     return "\n".join(inventory_list)
 
+# Parsed memory bank keyed by the files' mtimes, so unchanged files aren't re-read
+_mem_cache = {}
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+def _is_recent(entry, cutoff):
+    # Zero-padded ISO dates sort as strings, so no per-entry parsing is needed.
+    # Strictly after: a date on the cutoff day is midnight, which is before the cutoff time.
+    return entry["date"] > cutoff
+
+def _read_recent_suggestions(cutoff):
+    """Streams the suggestions log, keeping only entries after the cutoff date string."""
+    recent = []
+    try:
+        with open(SUGGESTIONS_FILE, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # e.g. a line cut short by a crash mid-append
+                    print(f"⚠️ Skipping unreadable meal history line: {line.rstrip()}")
+                    continue
+                if _is_recent(entry, cutoff):
+                    recent.append(entry)
+    except FileNotFoundError:
+        pass
+    return recent
+
 def read_memory_bank():
-    """Reads the local JSON memory bank for family preferences and history."""
+    """
+    Reads the local JSON memory bank for family preferences and history.
+    Meal history comes from the append-only suggestions log, pruned to the last 7 days.
+    """
+    key = (_mtime(MEMORY_BANK_FILE), _mtime(SUGGESTIONS_FILE))
+    # Callers mutate what they get back, so always hand out a copy of the cache
+    if _mem_cache.get("key") == key:
+        return copy.deepcopy(_mem_cache["data"])
+    
     try:
-        with open("memory_bank.json", "r") as f:
-            return json.load(f)
+        with open(MEMORY_BANK_FILE, "r") as f:
+            data = json.load(f)
     except FileNotFoundError:
         # Default structure if file doesn't exist
-        return {
+        data = {
             "dislikes": [], 
             "favorites": ["Daal Chawal", "Chicken Handi White"], 
-            "last_7_days_suggestions": [] 
         }
+    
+    # Entries saved before the suggestions log existed may still live in the JSON
+    # file; skip any already migrated so a retried migration can't duplicate them
+    cutoff = (datetime.now() - timedelta(days=7)).strftime(DATE_FORMAT)
+    logged = _read_recent_suggestions(cutoff)
+    unmigrated = [
+        entry for entry in data.get("last_7_days_suggestions", [])
+        if _is_recent(entry, cutoff) and entry not in logged
+    ]
+    data["last_7_days_suggestions"] = unmigrated + logged
+    
+    _mem_cache.update(key=key, data=data, unmigrated=unmigrated)
+    return copy.deepcopy(data)
+
+def _migrate_legacy_suggestions():
+    """Moves recent meal history still stored in the JSON file into the suggestions log."""
+    read_memory_bank()  # Refreshes the cache only if either file changed
+    if _mem_cache["unmigrated"]:
+        _append_to_log(_mem_cache["unmigrated"])
+
+def _append_to_log(entries):
+    """Appends entries to the suggestions log, one JSON object per line."""
+    with open(SUGGESTIONS_FILE, "a+b") as f:
+        # Start on a fresh line if a previous append was cut short
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.writelines((json.dumps(entry) + "\n").encode() for entry in entries)
 
 def write_memory_bank(data: dict):
-    """Writes data to the memory bank JSON file."""
-    with open("memory_bank.json", "w") as f:
-        json.dump(data, f, indent=2)
+    """
+    Writes preferences to the memory bank JSON file.
+    Written to a temp file and renamed so a crash can't leave a truncated file.
+    Meal history is not rewritten here; it lives in the suggestions log.
+    """
+    # The history key is dropped below, so carry any old entries over first
+    _migrate_legacy_suggestions()
+    preferences = {k: v for k, v in data.items() if k != "last_7_days_suggestions"}
+    tmp_file = MEMORY_BANK_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(preferences, f)
+    os.replace(tmp_file, MEMORY_BANK_FILE)
+    _mem_cache.clear()
     return "Memory bank updated successfully."
 
 def update_preferences(favorite: str = None, dislike: str = None):
@@ -215,7 +324,11 @@ def update_preferences(favorite: str = None, dislike: str = None):
     write_memory_bank(memory)
     return f"Preferences updated. Favorites: {memory.get('favorites', [])}, Dislikes: {memory.get('dislikes', [])}"
 
-def save_selected_meal(meal_name: str):
+def _append_suggestion(entry: dict):
+    _append_to_log([entry])
+    _mem_cache.clear()
+
+async def save_selected_meal(meal_name: str):
     """
     Saves the selected meal to the last 7 days suggestions.
     Used by the Selection Agent to track recent meal choices.
@@ -223,72 +336,69 @@ def save_selected_meal(meal_name: str):
     Args:
         meal_name: The name of the meal that was selected
     """
-    memory = read_memory_bank()
-    
     # Add the meal with timestamp
     suggestion_entry = {
         "meal": meal_name,
-        "date": datetime.now().strftime("%Y-%m-%d")
+        "date": datetime.now().strftime(DATE_FORMAT)
     }
     
-    # Initialize list if it doesn't exist
-    if "last_7_days_suggestions" not in memory:
-        memory["last_7_days_suggestions"] = []
-    
-    # Add new suggestion
-    memory["last_7_days_suggestions"].append(suggestion_entry)
+    # Append one line to the log (off the event loop); old entries are pruned when reading
+    await asyncio.to_thread(_append_suggestion, suggestion_entry)
     
-    # Keep only last 7 days (prune old entries)
-    cutoff_date = datetime.now() - timedelta(days=7)
-    memory["last_7_days_suggestions"] = [
-        entry for entry in memory["last_7_days_suggestions"]
-        if datetime.strptime(entry["date"], "%Y-%m-%d") >= cutoff_date
-    ]
-    
-    write_memory_bank(memory)
     print(f"💾 Saved '{meal_name}' to meal history")
     return f"Saved '{meal_name}' to last 7 days suggestions."
 
-def send_discord_notification(message: str):
-    """Sends the final meal plan to Discord."""
+@functools.lru_cache(maxsize=1)
+def _discord_client():
+    """
+    Shared Discord HTTP client, reused across runs for keep-alive.
+    Sync rather than async so it isn't tied to one event loop's asyncio.run().
+    """
+    return httpx.Client(timeout=5.0)
+
+async def send_discord_notification(message: str):
+    """Sends the final meal plan to Discord without blocking the event loop."""
     print("📨 Sending notification to Discord...")
-    webhook = DiscordWebhook(url=DISCORD_WEBHOOK_URL, content=message)
-    response = webhook.execute()
+    response = await asyncio.to_thread(
+        _discord_client().post, DISCORD_WEBHOOK_URL, json={"content": message}
+    )
     return f"Notification sent. Status: {response.status_code}"
 
-# --- Agents & Prompts ---
+async def prefetch_kitchen_data():
+    """
+    Fetches the grocery inventory and the memory bank concurrently.
+    Both are blocking I/O (Sheets API and local disk), so they run in worker
+    threads and overlap instead of waiting on each other.
+    """
+    inventory, memory = await asyncio.gather(
+        asyncio.to_thread(fetch_recent_grocery_data),
+        asyncio.to_thread(read_memory_bank),
+    )
+    return inventory, memory
 
-# 1. Data Agent
-data_agent_prompt = """
-You are the **Inventory & Context Manager**.
-Your goal is to inspect the real grocery data and preparation history.
+# --- Agent & Prompt ---
 
-1. **Get Real Inventory:** Call `fetch_recent_grocery_data` to see what was bought recently.
-2. **Check Memory:** Call `read_memory_bank` to see what was suggested in the last 7 days to avoid repeats.
-3. **Report:** Output a 'Kitchen State' summary.
-   - List the AVAILABLE INGREDIENTS (vegetables, spices, condiments, poultry) based on the tool output.
-   - List the FORBIDDEN MEALS (those suggested in the last 7 days).
-"""
+# One agent walks through all three stages in a single conversation, so the
+# kitchen report and meal options don't each cost a separate LLM round-trip.
+meal_planner_prompt = """
+You are the family's **Meal Planner**. Work through the three stages below in order.
 
-data_agent = Agent(
-    name="KitchenManager",
-    model=model,
-    instruction=data_agent_prompt,
-    tools=[fetch_recent_grocery_data, read_memory_bank],
-    output_key="kitchen_state",
-)
+The real grocery data and preparation history have already been fetched for you:
+**RECENT GROCERIES** (one per line as ITEM|QTYUNIT|CATEGORY|MM-DD bought):
+{inventory}
+**MEMORY BANK:** {memory}
 
-# 2. Planner Agent
-planner_agent_prompt = """
-You are the **Creative Chef**.
-You must generate lunch options based **ONLY** on the following data:
-**KITCHEN STATE REPORT:** {kitchen_state}
+### Stage 1 - Inventory & Context Manager
+Build a 'Kitchen State' summary.
+   - List the AVAILABLE INGREDIENTS (vegetables, spices, condiments, poultry) based on the recent groceries.
+   - List the FORBIDDEN MEALS (those suggested in the last 7 days, to avoid repeats).
 
-Your goal is to generate **3 distinct Lunch Options**.
+### Stage 2 - Creative Chef
+Generate **3 distinct Lunch Options** based **ONLY** on the Kitchen State.
 
 **Constraint Checklist:**
-1. MUST use at least one 'Available Ingredient' (vegetables, spices, condiments, or poultry) listed in the report.
-2. MUST NOT be a 'Forbidden Meal' listed in the report.
+1. MUST use at least one 'Available Ingredient' (vegetables, spices, condiments, or poultry) from the Kitchen State.
+2. MUST NOT be a 'Forbidden Meal' from the Kitchen State.
 3. If the user has 'Favorites' in memory that match the ingredients, prioritize one of them.
 4. OPTIONAL: If you identify a meal that should be added to favorites or dislikes based on patterns, 
    you can use the `update_preferences` tool to save it.
@@ -297,48 +407,55 @@ Output format:
 1. [Meal Name] - [Main Ingredients] - [Reason]
 2. [Meal Name] - ...
 3. [Meal Name] - ...
-"""
 
-planner_agent = Agent(
-    name="CreativeChef",
-    model=model,
-    instruction=planner_agent_prompt,
-    tools=[update_preferences],
-    output_key="meal_options"
-)
-
-# 3. Selection Agent
-selection_agent_prompt = """
-You are the **Final Decision Maker**.
-Review the following meal options and select the single best choice:
-**MEAL OPTIONS:** {meal_options}
-
-**Action:**
-1. Pick the SINGLE best lunch option from the list above. The selection criteria is to maximize perishable ingredient use or prioritize a family favorite.
-2. Use the `save_selected_meal` tool to record your selection in the memory bank (pass ONLY the meal name).
-3. Draft the final, beautiful Discord message based on your selection (use bolding and emojis).
-4. Use the `send_discord_notification` tool with your drafted message as the argument.
+### Stage 3 - Final Decision Maker
+1. Pick the SINGLE best lunch option from your list. The selection criteria is to maximize perishable ingredient use or prioritize a family favorite.
+2. Draft the final, beautiful Discord message based on your selection (use bolding and emojis).
+3. In the SAME turn, call both tools together so they run concurrently:
+   - `save_selected_meal` to record your selection in the memory bank (pass ONLY the meal name).
+   - `send_discord_notification` with your drafted message as the argument.
 """
 
-selection_agent = Agent(
-    name="DecisionMaker",
+root_agent = Agent(
+    name="MealPlanner",
     model=model,
-    instruction=selection_agent_prompt,
-    tools=[save_selected_meal, send_discord_notification],
+    instruction=meal_planner_prompt,
+    tools=[update_preferences, save_selected_meal, send_discord_notification],
 )
 
 
 async def run_meal_planner():
     print("🚀 Starting Agentic Meal Planner...")
-    
-    root_agent = SequentialAgent(
-        name="MealPlanner",
-        sub_agents=[data_agent, planner_agent, selection_agent]
-    )
+
+    # Sheets and memory bank I/O happen up front; the agent receives the results via state
+    inventory, memory = await prefetch_kitchen_data()
 
     runner = InMemoryRunner(agent=root_agent)
-    response = await runner.run_debug("Check the fridge and plan tomorrow's lunch.")
-    return response
+    await runner.session_service.create_session(
+        app_name=runner.app_name,
+        user_id=USER_ID,
+        session_id=SESSION_ID,
+        state={"inventory": inventory, "memory": json.dumps(memory)},
+    )
+    
+    # Stream the model's text as it is generated instead of waiting for whole turns
+    message = types.Content(role="user", parts=[types.Part(text="Check the fridge and plan tomorrow's lunch.")])
+    events = []
+    async for event in runner.run_async(
+        user_id=USER_ID,
+        session_id=SESSION_ID,
+        new_message=message,
+        run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+    ):
+        events.append(event)
+        if event.content and event.content.parts:
+            text = "".join(part.text or "" for part in event.content.parts)
+            # Partial chunks are printed live; the final event repeats the full text
+            if event.partial:
+                print(text, end="", flush=True)
+            elif text:
+                print()
+    return events
 
 if __name__ == "__main__":
     asyncio.run(run_meal_planner())